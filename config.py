@@ -18,12 +18,36 @@ DEFAULT_HEADERS = {
     'Upgrade-Insecure-Requests': '1',
 }
 
+# Headers for Yahoo Finance Japan quote page scraping
+YAHOO_JP_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+}
+
+# Concurrent stock price scraping
+SCRAPER_MAX_WORKERS = 12
+# Minimum seconds between request starts across all scraper threads
+SCRAPER_REQUEST_INTERVAL = 0.1
+
+# On-disk cache for scraped pages, keyed by URL and date
+# Entries older than the TTL are refetched so intraday runs still see fresh prices
+HTTP_CACHE_TTL = 300  # seconds
+HTTP_CACHE_MAX_BYTES = 500 * 1024 * 1024
+
+# Seconds a top-20 market cap scrape is reused by the web API
+MARKET_CAP_CACHE_TTL = 60
+
 # Default data folder
 DEFAULT_BASE_FOLDER = "nikkei_local"
 
+# Rows expected in the price adjustment factor download (one per index constituent)
+NIKKEI_CONSTITUENT_COUNT = 225
+
+# Low-cardinality master data columns held as pandas categoricals
+MASTER_CATEGORY_COLUMNS = ['業種', 'セクター']
+
 # Top 20 stocks by market cap (Nikkei-based, updated manually)
 # Last updated: 2025-08
-TOP_20_MARKET_CAP = [
+TOP_20_MARKET_CAP = (
     ('7203', 'トヨタ自動車'),
     ('8306', '三菱ＵＦＪフィナンシャル・グループ'),
     ('6758', 'ソニーグループ'),
@@ -44,4 +68,4 @@ TOP_20_MARKET_CAP = [
     ('7267', 'ホンダ'),
     ('8031', '三井物産'),
     ('6367', 'ダイキン工業'),
-]
\ No newline at end of file
+)
@@ -5,6 +5,21 @@ Nikkei Contribution Calculator - Performs all contribution calculations
 import pandas as pd
 import numpy as np
 import os
+from concurrent.futures import ThreadPoolExecutor
+
+from data_manager import read_csv_cached, read_master_data
+
+
+def _contribution_kernel(price_changes, factors, nikkei_changes):
+    """Relative contribution matrix (dates × stocks) from float64 price changes, factors and index changes"""
+    # Weighted change matrix and per-date totals
+    weighted = price_changes * factors
+    totals = np.nansum(weighted, axis=1, keepdims=True)
+    
+    # Branchless masking: divide by 1.0 where the total is too small, then zero those rows
+    valid = np.abs(totals) > 1e-10
+    totals_safe = np.where(valid, totals, 1.0)
+    return np.where(valid, nikkei_changes[:, None] * weighted / totals_safe, 0.0)
 
 
 class NikkeiContributionCalculator:
@@ -14,6 +29,13 @@ class NikkeiContributionCalculator:
         self.folder_path = folder_path
         self.contributions_folder = os.path.join(folder_path, "contributions")
         
+    def _load_master_data(self):
+        """Load master data through the data manager's shared loader"""
+        master_df = read_master_data(self.folder_path)
+        if master_df is None:
+            raise FileNotFoundError(os.path.join(self.folder_path, "master_data.csv"))
+        return master_df
+    
     def _load_data(self):
         """Load all necessary data files"""
         try:
@@ -28,30 +50,11 @@ class NikkeiContributionCalculator:
                 print("ℹ Stock prices file not found (will be created during download)")
             
             # Load master data
-            master_data_path = os.path.join(self.folder_path, "master_data.csv")
-            # Try different encodings
-            for encoding in ['shift-jis', 'utf-8', 'cp932']:
-                try:
-                    master_df = pd.read_csv(master_data_path, encoding=encoding)
-                    master_df.columns = master_df.columns.str.strip()
-                    break
-                except UnicodeDecodeError:
-                    continue
+            master_df = self._load_master_data()
             
             # Load Nikkei daily data
             nikkei_daily_path = os.path.join(self.folder_path, "daily_data.csv")
-            
-            # Try different encodings for daily_data.csv
-            for encoding in ['shift-jis', 'utf-8', 'cp932']:
-                try:
-                    nikkei_df = pd.read_csv(nikkei_daily_path, encoding=encoding, skipfooter=1, engine='python')
-                    nikkei_df.columns = nikkei_df.columns.str.strip()
-                    print(f"✓ Loaded daily_data.csv with encoding: {encoding}")
-                    break
-                except UnicodeDecodeError:
-                    continue
-            else:
-                raise ValueError("Could not decode daily_data.csv with any encoding")
+            nikkei_df = read_csv_cached(nikkei_daily_path, skipfooter=1)
             nikkei_df['データ日付'] = pd.to_datetime(nikkei_df['データ日付'])
             nikkei_df.set_index('データ日付', inplace=True)
             
@@ -63,139 +66,87 @@ class NikkeiContributionCalculator:
     
     def _create_adjustment_factor_mapping(self, master_df):
         """Create mapping of stock codes to adjustment factors"""
-        adjustment_factors = {}
-        for _, row in master_df.iterrows():
-            try:
-                code = str(row['コード']).strip()
-                factor = float(row['株価換算係数'])
-                adjustment_factors[code] = factor
-            except (ValueError, TypeError):
-                # Skip invalid entries
-                continue
-        return adjustment_factors
+        codes = master_df['コード'].astype(str).str.strip().to_numpy()
+        factors = pd.to_numeric(master_df['株価換算係数'], errors='coerce').to_numpy(dtype=np.float64)
+        # Skip invalid entries
+        valid = ~np.isnan(factors)
+        return dict(zip(codes[valid], factors[valid].tolist()))
     
-    def _find_matching_column(self, code, columns):
-        """Find matching column for stock code"""
-        code_str = str(code)
-        code_int = int(code) if isinstance(code, str) and code.isdigit() else code
-        
+    def _build_column_index(self, columns):
+        """Build lookup of normalized stock code -> original column label"""
+        column_index = {str(col): col for col in columns}
         for col in columns:
-            # Try exact string match first
-            if str(col) == code_str:
-                return col
-            # Try integer comparison
-            try:
-                col_int = int(col) if isinstance(col, str) and col.isdigit() else col
-                if col_int == code_int:
-                    return col
-            except (ValueError, TypeError):
-                continue
-        return None
+            col_str = str(col).strip()
+            if col_str.isdigit():
+                column_index.setdefault(str(int(col_str)), col)
+        return column_index
     
     def _calculate_individual_contributions(self, price_changes, master_df, adjustment_factors, nikkei_changes):
         """Calculate individual stock contributions using relative method"""
         try:
-            # Prepare to collect all contributions
-            all_contributions = []
-            
-            for date in price_changes.index:
-                date_contributions = {}
-                daily_price_changes = price_changes.loc[date]
-                nikkei_change = float(nikkei_changes.get(date, 0))
-                
-                # Calculate weighted changes for all stocks
-                total_weighted_change = 0.0
-                weighted_changes = {}
-                
-                for code in adjustment_factors.keys():
-                    matching_col = self._find_matching_column(code, daily_price_changes.index)
-                    if matching_col is not None and pd.notna(daily_price_changes[matching_col]):
-                        try:
-                            # Ensure numeric types
-                            price_change = float(daily_price_changes[matching_col])
-                            factor = float(adjustment_factors[code])
-                            weighted_change = price_change * factor
-                            weighted_changes[code] = weighted_change
-                            total_weighted_change += weighted_change
-                        except (ValueError, TypeError):
-                            # Skip if conversion fails
-                            continue
-                
-                # Calculate individual contributions using relative method
-                for code, weighted_change in weighted_changes.items():
-                    try:
-                        if abs(total_weighted_change) > 1e-10:  # Avoid division by very small numbers
-                            contribution = float(nikkei_change) * (float(weighted_change) / float(total_weighted_change))
-                            date_contributions[str(code)] = contribution
-                        else:
-                            date_contributions[str(code)] = 0.0
-                    except (ValueError, TypeError, ZeroDivisionError):
-                        date_contributions[str(code)] = 0.0
-                
-                # Add date to the contributions
-                date_contributions['date'] = date
-                all_contributions.append(date_contributions)
-            
-            # Create DataFrame from list of dictionaries
-            if all_contributions:
-                df = pd.DataFrame(all_contributions)
-                df.set_index('date', inplace=True)
-                # Fill NaN values with 0
-                df = df.fillna(0)
-                return df
-            else:
+            # Align price change columns with the codes that have adjustment factors
+            column_index = self._build_column_index(price_changes.columns)
+            aligned_codes = [code for code in adjustment_factors.keys() if str(code) in column_index]
+            aligned_columns = [column_index[str(code)] for code in aligned_codes]
+            
+            if price_changes.empty or not aligned_codes:
                 return pd.DataFrame()
             
+            factors = np.array([adjustment_factors[code] for code in aligned_codes], dtype=np.float64)
+            price_arr = np.ascontiguousarray(price_changes[aligned_columns].to_numpy(dtype=np.float64))
+            nikkei_arr = np.array([nikkei_changes.get(date, 0.0) for date in price_changes.index], dtype=np.float64)
+            contrib = _contribution_kernel(price_arr, factors, nikkei_arr)
+            
+            df = pd.DataFrame(contrib, index=price_changes.index, columns=[str(code) for code in aligned_codes])
+            df.index.name = 'date'
+            # Drop stocks without any price data, fill remaining NaN values with 0
+            df = df.dropna(axis=1, how='all').fillna(0)
+            return df
+            
         except Exception as e:
             print(f"✗ Error calculating individual contributions: {e}")
             import traceback
             traceback.print_exc()
             return pd.DataFrame()
     
+    def _canonical_column_order(self, master_column, columns):
+        """Order group columns by first appearance in master data, unknown groups last"""
+        present = set(columns)
+        order = [group for group in master_column.dropna().unique() if group in present]
+        ordered = set(order)
+        return order + [group for group in columns if group not in ordered]
+    
     def _calculate_sector_industry_contributions(self, stock_contributions, master_df):
         """Calculate sector and industry level contributions"""
         try:
             # Create mappings
-            sector_mapping = {}
-            industry_mapping = {}
-            
-            for _, row in master_df.iterrows():
-                code = str(row['コード'])
-                sector = row['セクター']
-                industry = row['業種']
-                sector_mapping[code] = sector
-                industry_mapping[code] = industry
-            
-            # Calculate sector contributions
-            sector_contributions = pd.DataFrame(index=stock_contributions.index)
-            industry_contributions = pd.DataFrame(index=stock_contributions.index)
-            
-            for date in stock_contributions.index:
-                sector_sums = {}
-                industry_sums = {}
-                
-                for code in stock_contributions.columns:
-                    if pd.notna(stock_contributions.loc[date, code]):
-                        contribution = stock_contributions.loc[date, code]
-                        
-                        # Sector
-                        sector = sector_mapping.get(code, 'Unknown')
-                        if sector not in sector_sums:
-                            sector_sums[sector] = 0
-                        sector_sums[sector] += contribution
-                        
-                        # Industry
-                        industry = industry_mapping.get(code, 'Unknown')
-                        if industry not in industry_sums:
-                            industry_sums[industry] = 0
-                        industry_sums[industry] += contribution
-                
-                # Add to dataframes
-                for sector, sum_val in sector_sums.items():
-                    sector_contributions.loc[date, sector] = sum_val
-                
-                for industry, sum_val in industry_sums.items():
-                    industry_contributions.loc[date, industry] = sum_val
+            codes = master_df['コード'].astype(str)
+            sector_mapping = dict(zip(codes, master_df['セクター']))
+            industry_mapping = dict(zip(codes, master_df['業種']))
+            
+            # Group stock columns by sector / industry and sum per date
+            sector_keys = stock_contributions.columns.map(sector_mapping).fillna('Unknown')
+            industry_keys = stock_contributions.columns.map(industry_mapping).fillna('Unknown')
+            
+            if len(stock_contributions) == 1:
+                # Real-time path has a single date: group the 1-D row directly
+                row = stock_contributions.iloc[0]
+                sector_contributions = row.groupby(sector_keys, sort=False).sum().to_frame().T
+                industry_contributions = row.groupby(industry_keys, sort=False).sum().to_frame().T
+                sector_contributions.index = stock_contributions.index
+                industry_contributions.index = stock_contributions.index
+            else:
+                # groupby(axis=1) is deprecated in pandas 2.x, so group the transposed frame
+                sector_contributions = stock_contributions.T.groupby(sector_keys, sort=False).sum().T
+                industry_contributions = stock_contributions.T.groupby(industry_keys, sort=False).sum().T
+            
+            # Canonical column order follows master data, with any unmapped groups last
+            sector_contributions = sector_contributions[
+                self._canonical_column_order(master_df['セクター'], sector_contributions.columns)
+            ]
+            industry_contributions = industry_contributions[
+                self._canonical_column_order(master_df['業種'], industry_contributions.columns)
+            ]
             
             return sector_contributions, industry_contributions
             
@@ -203,6 +154,17 @@ class NikkeiContributionCalculator:
             print(f"✗ Error calculating sector/industry contributions: {e}")
             return pd.DataFrame(), pd.DataFrame()
     
+    def _save_result(self, name, df):
+        """Save one result table as CSV plus a Parquet copy, returning the written paths"""
+        output_path = os.path.join(self.contributions_folder, f"{name}.csv")
+        df.to_csv(output_path, encoding='utf-8', float_format='%.6f', chunksize=10000)
+        
+        # Parquet copy for fast, dtype-preserving reloads by the webapp
+        parquet_path = os.path.join(self.contributions_folder, f"{name}.parquet")
+        df.to_parquet(parquet_path, engine='pyarrow', compression='snappy')
+        
+        return output_path, parquet_path
+    
     def calculate_all_contributions(self, data_manager=None, stock_prices_dict=None, nikkei_change=None):
         """Calculate all contribution analyses using real-time data only"""
         try:
@@ -211,17 +173,10 @@ class NikkeiContributionCalculator:
             print("=" * 50)
             
             # Load master data only (no daily data needed)
-            master_data_path = os.path.join(self.folder_path, "master_data.csv")
-            for encoding in ['shift-jis', 'utf-8', 'cp932']:
-                try:
-                    master_df = pd.read_csv(master_data_path, encoding=encoding)
-                    master_df.columns = master_df.columns.str.strip()
-                    print(f"✓ Master data loaded with encoding: {encoding}")
-                    break
-                except UnicodeDecodeError:
-                    continue
-            else:
-                print("✗ Failed to load master data")
+            try:
+                master_df = self._load_master_data()
+            except (OSError, ValueError) as e:
+                print(f"✗ Failed to load master data: {e}")
                 return None
             
             print(f"Master data codes: {list(master_df['コード'].head())}")
@@ -238,16 +193,15 @@ class NikkeiContributionCalculator:
                 print("✗ Stock prices dict not provided")
                 return None
             
-            # Use the dictionary passed from webapp
-            price_changes_dict = {}
-            for code, data in stock_prices_dict.items():
-                if 'change' in data and pd.notna(data['change']):
-                    price_changes_dict[str(code)] = float(data['change'])
+            # Use the dictionary passed from webapp (missing/None changes become NaN and are dropped)
+            codes_arr = np.array([str(code) for code in stock_prices_dict], dtype=object)
+            changes_arr = np.array([data.get('change') for data in stock_prices_dict.values()], dtype=np.float64)
+            valid = np.isfinite(changes_arr)
             
             # Create a DataFrame with today's date
             today = pd.Timestamp.now().normalize()
-            price_changes = pd.DataFrame([price_changes_dict], index=[today])
-            print(f"✓ Price changes from dict: {len(price_changes_dict)} stocks")
+            price_changes = pd.DataFrame(changes_arr[valid][None, :], index=pd.DatetimeIndex([today]), columns=codes_arr[valid])
+            print(f"✓ Price changes from dict: {int(valid.sum())} stocks")
             print(f"✓ Price changes prepared: {price_changes.shape}")
             
             # Use provided Nikkei change (from real-time data)
@@ -285,11 +239,14 @@ class NikkeiContributionCalculator:
                 'industry_contributions': industry_contributions
             }
             
-            for name, df in results.items():
-                if not df.empty:
-                    output_path = os.path.join(self.contributions_folder, f"{name}.csv")
-                    df.to_csv(output_path, encoding='utf-8')
-                    print(f"✓ Saved: {output_path}")
+            # Writes are I/O bound, so save the result tables concurrently
+            to_save = [(name, df) for name, df in results.items() if not df.empty]
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                saved_paths = list(executor.map(lambda item: self._save_result(*item), to_save))
+            
+            for paths in saved_paths:
+                for path in paths:
+                    print(f"✓ Saved: {path}")
             
             print("Contribution calculations completed successfully\n")
             return results
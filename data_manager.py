@@ -5,14 +5,182 @@ Nikkei Data Manager - Handles all data acquisition for Nikkei 225 analysis
 import pandas as pd
 import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 import os
+import io
+import codecs
+import csv
+import hashlib
 import time
-from datetime import datetime, timedelta
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
 import json
 import re
+from collections import OrderedDict
+from functools import lru_cache
 
-from config import DEFAULT_HEADERS, DEFAULT_BASE_FOLDER
+from config import (
+    DEFAULT_HEADERS, DEFAULT_BASE_FOLDER, SCRAPER_MAX_WORKERS, SCRAPER_REQUEST_INTERVAL,
+    HTTP_CACHE_TTL, HTTP_CACHE_MAX_BYTES, MASTER_CATEGORY_COLUMNS, NIKKEI_CONSTITUENT_COUNT,
+)
+
+
+# Parsed CSVs keyed by (path, mtime, size, read options), least recently used first
+_CSV_CACHE = OrderedDict()
+_CSV_CACHE_MAX_ENTRIES = 8
+_CSV_CACHE_LOCK = threading.Lock()
+
+# Detected CSV encodings keyed by (path, mtime)
+_ENCODING_CACHE = {}
+
+# Numeric part of a scraped price string (commas removed first)
+_PRICE_RE = re.compile(r'[\d,]+\.?\d*')
+
+_JSON_DECODER = json.JSONDecoder()
+
+
+def _parse_price(text):
+    """Extract a float price from scraped text, or None if no number is found"""
+    match = _PRICE_RE.search(text.replace(',', ''))
+    return float(match.group()) if match else None
+
+
+def _dig(data, *keys):
+    """Follow nested dict keys, returning None as soon as a level is missing"""
+    for key in keys:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+        if data is None:
+            return None
+    return data
+
+
+def _json_float(value):
+    """Convert a scraped JSON price value ('1,234.5') to float, or None if empty/'---'/invalid"""
+    if not value or value == '---':
+        return None
+    try:
+        return float(str(value).replace(',', ''))
+    except ValueError:
+        return None
+
+
+def is_fresh_copy(copy_path, source_path):
+    """True if copy_path exists and is at least as new as source_path (or the source is missing)"""
+    if not os.path.exists(copy_path):
+        return False
+    return not os.path.exists(source_path) or os.path.getmtime(copy_path) >= os.path.getmtime(source_path)
+
+
+def detect_csv_encoding(path, sample_size=4096):
+    """Detect a CSV's encoding from its BOM / leading bytes, cached per path and mtime"""
+    cache_key = (path, os.path.getmtime(path))
+    if cache_key in _ENCODING_CACHE:
+        return _ENCODING_CACHE[cache_key]
+
+    with open(path, 'rb') as f:
+        sample = f.read(sample_size)
+
+    if sample.startswith(codecs.BOM_UTF8):
+        encoding = 'utf-8-sig'
+    elif sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        encoding = 'utf-16'
+    else:
+        try:
+            # Incremental decode tolerates a multibyte character cut off at the sample boundary
+            codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+            encoding = 'utf-8'
+        except UnicodeDecodeError:
+            # cp932 is the Windows superset of shift-jis used by Nikkei downloads
+            encoding = 'cp932'
+
+    _ENCODING_CACHE[cache_key] = encoding
+    return encoding
+
+
+def read_csv_cached(path, **kwargs):
+    """Read a CSV in one pass using its detected encoding, served from the in-memory LRU cache.
+    
+    Accepts pd.read_csv keyword arguments plus skipfooter; the returned frame is a copy
+    the caller may modify.
+    """
+    stat = os.stat(path)
+    cache_key = (path, stat.st_mtime_ns, stat.st_size, tuple(sorted((k, repr(v)) for k, v in kwargs.items())))
+    with _CSV_CACHE_LOCK:
+        if cache_key in _CSV_CACHE:
+            _CSV_CACHE.move_to_end(cache_key)
+            # Copy so callers can mutate the frame without touching the cached one
+            return _CSV_CACHE[cache_key].copy()
+
+    encoding = detect_csv_encoding(path)
+    with open(path, 'rb') as f:
+        raw = f.read()
+    try:
+        text = raw.decode(encoding)
+    except UnicodeDecodeError as e:
+        # Only the leading bytes were probed; a cp932 file can start with pure ASCII
+        if encoding != 'utf-8':
+            raise ValueError(f"Could not decode {os.path.basename(path)} as {encoding}: {e}")
+        try:
+            text = raw.decode('cp932')
+            encoding = 'cp932'
+        except UnicodeDecodeError:
+            raise ValueError(f"Could not decode {os.path.basename(path)} as utf-8 or cp932: {e}")
+        _ENCODING_CACHE[(path, os.path.getmtime(path))] = encoding
+
+    skipfooter = kwargs.pop('skipfooter', 0)
+    if skipfooter:
+        # The pyarrow engine has no skipfooter, so drop trailing lines before parsing
+        lines = text.rstrip('\r\n').splitlines()
+        text = '\n'.join(lines[:-skipfooter]) + '\n'
+
+    # Transcode to UTF-8 in memory so the multithreaded pyarrow parser can be used
+    df = pd.read_csv(io.BytesIO(text.encode('utf-8')), engine='pyarrow', **kwargs)
+    df.columns = df.columns.str.strip()
+    print(f"✓ Loaded {os.path.basename(path)} with encoding: {encoding}")
+
+    with _CSV_CACHE_LOCK:
+        _CSV_CACHE[cache_key] = df
+        while len(_CSV_CACHE) > _CSV_CACHE_MAX_ENTRIES:
+            _CSV_CACHE.popitem(last=False)
+    return df.copy()
+
+
+def read_master_data(folder_path):
+    """Read master data from folder_path, preferring master_data.parquet while it is at least as new as the CSV.
+    
+    Returns None if neither file exists.
+    """
+    master_data_path = os.path.join(folder_path, "master_data.csv")
+    master_parquet_path = os.path.join(folder_path, "master_data.parquet")
+    
+    if is_fresh_copy(master_parquet_path, master_data_path):
+        # Parquet stores strings as UTF-8 and keeps the categorical columns, so no conversion is needed
+        master_df = pd.read_parquet(master_parquet_path)
+        print(f"✓ Loaded {os.path.basename(master_parquet_path)}")
+        return master_df
+    
+    if not os.path.exists(master_data_path):
+        return None
+    
+    # Load with proper encoding; CSV round-trips categories as plain strings
+    master_df = read_csv_cached(master_data_path)
+    return master_df.astype(
+        {column: 'category' for column in MASTER_CATEGORY_COLUMNS if column in master_df.columns}
+    )
+
+
+@lru_cache(maxsize=1024)
+def _business_day_offset(day, offset_days):
+    """Weekday-only offset of a calendar date via numpy's business day calendar"""
+    if offset_days == 0:
+        return day
+    # A weekend start rolls against the direction of travel, matching day-by-day stepping
+    roll = 'backward' if offset_days > 0 else 'forward'
+    return np.busday_offset(np.datetime64(day, 'D'), offset_days, roll=roll).astype(date)
 
 
 class NikkeiDataManager:
@@ -22,6 +190,28 @@ class NikkeiDataManager:
         self.base_folder = base_folder
         self.headers = DEFAULT_HEADERS
         
+        # Pooled session shared by all requests (and scraper worker threads)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=SCRAPER_MAX_WORKERS, pool_maxsize=SCRAPER_MAX_WORKERS)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        
+        # On-disk cache of scraped pages
+        self.cache_dir = os.path.join(self.base_folder, "_http_cache")
+        
+        # Rate limiting shared across worker threads
+        self._rate_limit_lock = threading.Lock()
+        self._next_request_time = 0.0
+        
+    def _rate_limit(self):
+        """Space request starts at least SCRAPER_REQUEST_INTERVAL apart across all threads"""
+        with self._rate_limit_lock:
+            now = time.monotonic()
+            wait = self._next_request_time - now
+            self._next_request_time = max(now, self._next_request_time) + SCRAPER_REQUEST_INTERVAL
+        if wait > 0:
+            time.sleep(wait)
+        
     def download_master_data(self):
         """Download all master data files"""
         print("=" * 50)
@@ -65,38 +255,35 @@ class NikkeiDataManager:
             if not url:
                 raise ValueError(f"No URL mapping found for {filename}")
             
-            response = requests.get(url, headers=self.headers, timeout=30)
-            response.raise_for_status()
-            
-            # Direct CSV download with encoding conversion
+            # Stream the body to a temporary file instead of buffering it in memory
             file_path = os.path.join(self.base_folder, filename)
+            raw_path = file_path + '.part'
+            with self.session.get(url, headers=self.headers, timeout=30, stream=True) as response:
+                response.raise_for_status()
+                with open(raw_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=65536):
+                        f.write(chunk)
             
             # Try to decode and re-encode to fix character encoding
             try:
-                # Try different encodings for decoding
-                content_decoded = None
-                for encoding in ['shift-jis', 'cp932', 'utf-8']:
-                    try:
-                        content_decoded = response.content.decode(encoding)
-                        print(f"✓ Decoded {filename} with encoding: {encoding}")
-                        break
-                    except UnicodeDecodeError:
-                        continue
-                
-                if content_decoded is None:
-                    # If decoding fails, save as binary
-                    with open(file_path, 'wb') as f:
-                        f.write(response.content)
+                # Decode with the detected encoding, saving as UTF-8
+                encoding = detect_csv_encoding(raw_path)
+                transcoded = self._transcode_to_utf8(raw_path, file_path, encoding)
+                if not transcoded and encoding == 'utf-8':
+                    # Only the leading bytes were probed; a cp932 file can start with pure ASCII
+                    encoding = 'cp932'
+                    transcoded = self._transcode_to_utf8(raw_path, file_path, encoding)
+                if transcoded:
+                    print(f"✓ Decoded {filename} with encoding: {encoding}")
+                    os.remove(raw_path)
                 else:
-                    # Save as UTF-8
-                    with open(file_path, 'w', encoding='utf-8') as f:
-                        f.write(content_decoded)
+                    # If decoding fails, save as binary
+                    os.replace(raw_path, file_path)
                     
             except Exception as e:
                 print(f"Encoding conversion failed for {filename}: {e}")
                 # Fallback to binary save
-                with open(file_path, 'wb') as f:
-                    f.write(response.content)
+                os.replace(raw_path, file_path)
             
             print(f"✓ Downloaded and processed: {file_path}")
             return True
@@ -105,6 +292,70 @@ class NikkeiDataManager:
             print(f"✗ Error downloading {filename}: {e}")
             return False
     
+    def _cached_get(self, url, timeout=10):
+        """GET url and return the body, served from the on-disk cache while fresh"""
+        key = hashlib.blake2b(f"{url}:{date.today().isoformat()}".encode('utf-8'), digest_size=16).hexdigest()
+        cache_path = os.path.join(self.cache_dir, key)
+        
+        try:
+            if time.time() - os.path.getmtime(cache_path) < HTTP_CACHE_TTL:
+                with open(cache_path, 'rb') as f:
+                    content = f.read()
+                os.utime(cache_path, (time.time(), os.path.getmtime(cache_path)))
+                return content
+        except OSError:
+            pass  # Not cached yet
+        
+        self._rate_limit()
+        response = self.session.get(url, headers=self.headers, timeout=timeout)
+        response.raise_for_status()
+        content = response.content
+        
+        # Store atomically (unique temp name per thread); the size cap is enforced once per scrape run
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"HTTP cache write failed for {url}: {e}")
+        
+        return content
+    
+    def _evict_http_cache(self):
+        """Remove least recently used cache entries while the cache exceeds HTTP_CACHE_MAX_BYTES"""
+        try:
+            entries = [entry for entry in os.scandir(self.cache_dir)
+                       if entry.is_file() and not entry.name.endswith('.tmp')]
+        except OSError:
+            return  # No cache written yet
+        total_size = sum(entry.stat().st_size for entry in entries)
+        if total_size <= HTTP_CACHE_MAX_BYTES:
+            return
+        
+        for entry in sorted(entries, key=lambda entry: entry.stat().st_atime):
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                total_size -= size
+            except OSError:
+                continue
+            if total_size <= HTTP_CACHE_MAX_BYTES:
+                break
+    
+    def _transcode_to_utf8(self, src_path, dst_path, encoding, chunk_size=65536):
+        """Stream-decode src_path with encoding into UTF-8 dst_path; False if it does not decode"""
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            with open(src_path, 'rb') as src, open(dst_path, 'w', encoding='utf-8') as dst:
+                for chunk in iter(lambda: src.read(chunk_size), b''):
+                    dst.write(decoder.decode(chunk))
+                dst.write(decoder.decode(b'', final=True))
+            return True
+        except UnicodeDecodeError:
+            return False
+    
     def _process_downloaded_files(self):
         """Process downloaded files and create master_data.csv"""
         try:
@@ -113,58 +364,45 @@ class NikkeiDataManager:
             # Load price_adjustment_factor.csv
             price_factor_path = os.path.join(self.base_folder, "price_adjustment_factor.csv")
             
-            # Try different encodings for the downloaded file
-            for encoding in ['shift-jis', 'utf-8', 'cp932']:
-                try:
-                    df = pd.read_csv(price_factor_path, encoding=encoding)
-                    df.columns = df.columns.str.strip()
-                    print(f"✓ Loaded price_adjustment_factor.csv with encoding: {encoding}")
-                    break
-                except UnicodeDecodeError:
-                    continue
-            else:
-                raise ValueError("Could not decode price_adjustment_factor.csv with any encoding")
+            # The download ends with a one-field copyright footer line; any other malformed row still raises
+            df = read_csv_cached(price_factor_path, skipfooter=1)
             
             # Create master_data.csv with proper structure (no date column needed)
-            master_data = []
-            
-            for idx, row in df.iterrows():
-                try:
-                    # Skip rows with NaN values in critical fields
-                    if pd.isna(row['コード']) or pd.isna(row['銘柄名']):
-                        continue
-                    
-                    # Clean and convert code
-                    code = str(row['コード']).strip().strip('"')
-                    
-                    try:
-                        # Convert to int to remove decimal, then back to string
-                        code = str(int(float(code)))
-                    except (ValueError, TypeError):
-                        continue  # Skip invalid codes
-                    
-                    # Clean other fields
-                    name = str(row['銘柄名']).strip().strip('"')
-                    sector = str(row['業種']).strip().strip('"') if not pd.isna(row['業種']) else 'Unknown'
-                    category = str(row['セクター']).strip().strip('"') if 'セクター' in row and not pd.isna(row['セクター']) else 'Unknown'
-                    
-                    master_data.append({
-                        'コード': code,
-                        '銘柄名': name,
-                        '株価換算係数': row['株価換算係数'],
-                        '業種': sector,
-                        'セクター': category
-                    })
-                    
-                except Exception:
-                    continue
+            # Skip rows with NaN values in critical fields
+            df = df.dropna(subset=['コード', '銘柄名'])
+            
+            def clean_text(series):
+                return series.astype(str).str.strip().str.strip('"')
+            
+            # Clean and convert code: to int to remove decimal, then back to string
+            codes = pd.to_numeric(clean_text(df['コード']), errors='coerce')
+            valid = codes.notna()  # Skip invalid codes
+            df = df[valid]
+            
+            # Clean other fields, filling missing industry/sector with 'Unknown'
+            sector = df['業種']
+            category = df['セクター'] if 'セクター' in df.columns else pd.Series(pd.NA, index=df.index)
+            master_df = pd.DataFrame({
+                'コード': codes[valid].astype('int64').astype(str),
+                '銘柄名': clean_text(df['銘柄名']),
+                '株価換算係数': df['株価換算係数'],
+                '業種': clean_text(sector).where(sector.notna(), 'Unknown'),
+                'セクター': clean_text(category).where(category.notna(), 'Unknown'),
+            })
+            master_df = master_df.astype({column: 'category' for column in MASTER_CATEGORY_COLUMNS})
+            
+            if len(master_df) != NIKKEI_CONSTITUENT_COUNT:
+                print(f"⚠ Expected {NIKKEI_CONSTITUENT_COUNT} constituents in {os.path.basename(price_factor_path)}, got {len(master_df)}")
             
             # Save master_data.csv
-            master_df = pd.DataFrame(master_data)
             master_data_path = os.path.join(self.base_folder, "master_data.csv")
             master_df.to_csv(master_data_path, index=False, encoding='utf-8')
             
-            print(f"✓ Created master_data.csv with {len(master_data)} stocks")
+            # Parquet copy for fast loads without encoding detection (codes stored as int like the CSV reads back)
+            master_parquet_path = os.path.join(self.base_folder, "master_data.parquet")
+            master_df.astype({'コード': 'int64'}).to_parquet(master_parquet_path, index=False, compression='zstd')
+            
+            print(f"✓ Created master_data.csv with {len(master_df)} stocks")
             return True
             
         except Exception as e:
@@ -174,25 +412,12 @@ class NikkeiDataManager:
     def load_master_data(self):
         """Load and return master data"""
         try:
-            master_data_path = os.path.join(self.base_folder, "master_data.csv")
-            
-            if not os.path.exists(master_data_path):
-                print(f"Master data file not found: {master_data_path}")
+            master_df = read_master_data(self.base_folder)
+            if master_df is None:
+                print(f"Master data file not found: {os.path.join(self.base_folder, 'master_data.csv')}")
                 return None
             
-            # Load with proper encoding
-            # Try different encodings
-            for encoding in ['utf-8', 'shift-jis', 'cp932']:
-                try:
-                    master_df = pd.read_csv(master_data_path, encoding=encoding)
-                    master_df.columns = master_df.columns.str.strip()
-                    print(f"✓ Loaded with encoding: {encoding}")
-                    print(f"✓ Columns: {list(master_df.columns)}")
-                    break
-                except UnicodeDecodeError:
-                    continue
-            else:
-                raise ValueError("Could not decode file with any encoding")
+            print(f"✓ Columns: {list(master_df.columns)}")
             
             print(f"✓ Master data loaded: {master_df.shape[0]} stocks")
             return master_df
@@ -215,46 +440,51 @@ class NikkeiDataManager:
             all_prices = {}
             successful_downloads = 0
             
-            for index, row in master_df.iterrows():
-                stock_code = row['コード']
-                company_name = row['銘柄名']
-                
-                print(f"Downloading prices for {stock_code} ({company_name})...")
-                
-                price_data = self._get_stock_price_yahoo_jp(stock_code)
+            stocks = list(master_df[['コード', '銘柄名']].itertuples(index=False, name=None))
+            print(f"Downloading prices for {len(stocks)} stocks with {SCRAPER_MAX_WORKERS} workers...")
+            
+            # Fetch concurrently over the pooled session; results come back in master order
+            with ThreadPoolExecutor(max_workers=SCRAPER_MAX_WORKERS) as executor:
+                price_results = list(executor.map(self._get_stock_price_yahoo_jp, [code for code, _ in stocks]))
+            
+            # One directory scan per run instead of one per cached page
+            self._evict_http_cache()
+            
+            for (stock_code, company_name), price_data in zip(stocks, price_results):
                 if price_data:
                     all_prices[stock_code] = price_data
                     successful_downloads += 1
-                    print(f"✓ {stock_code}: ¥{price_data['current_price']:,.1f} ({price_data['change']:+.1f})")
+                    print(f"✓ {stock_code} ({company_name}): ¥{price_data['current_price']:,.1f} ({price_data['change']:+.1f})")
                 else:
-                    print(f"✗ Failed to get price for {stock_code}")
-                
-                # Rate limiting
-                time.sleep(0.1)
+                    print(f"✗ Failed to get price for {stock_code} ({company_name})")
             
             # Save all prices to CSV in time-series format
             if all_prices:
                 # Create a DataFrame with stock codes as columns and today's date as index
                 today = pd.Timestamp.now().normalize()
-                price_data = {}
-                
-                for code, data in all_prices.items():
-                    price_data[code] = data['current_price']
+                price_data = {str(code): data['current_price'] for code, data in all_prices.items()}
                 
                 # Create DataFrame with date index
                 prices_df = pd.DataFrame([price_data], index=[today])
                 all_prices_path = os.path.join(stock_prices_folder, "all_stock_prices.csv")
                 
-                # If file exists, append new data
-                if os.path.exists(all_prices_path):
-                    existing_df = pd.read_csv(all_prices_path, index_col=0, parse_dates=True)
-                    # Update or append today's data
-                    if today in existing_df.index:
-                        existing_df.loc[today] = price_data
+                if not os.path.exists(all_prices_path):
+                    prices_df.to_csv(all_prices_path, encoding='utf-8')
+                else:
+                    # Read only the header and the date column to decide how to update
+                    with open(all_prices_path, encoding='utf-8', newline='') as f:
+                        header = next(csv.reader(f))[1:]
+                    existing_dates = pd.read_csv(all_prices_path, usecols=[0], index_col=0, parse_dates=True).index
+                    
+                    if today not in existing_dates and set(header) == set(prices_df.columns):
+                        # Append today's row in the file's column order
+                        with open(all_prices_path, 'a', encoding='utf-8', newline='') as f:
+                            prices_df[header].to_csv(f, header=False)
                     else:
-                        prices_df = pd.concat([existing_df, prices_df])
-                
-                prices_df.to_csv(all_prices_path, encoding='utf-8')
+                        # Replace today's row or add new stock columns: full rewrite
+                        existing_df = pd.read_csv(all_prices_path, index_col=0, parse_dates=True)
+                        existing_df = existing_df.drop(index=today, errors='ignore')
+                        pd.concat([existing_df, prices_df]).to_csv(all_prices_path, encoding='utf-8')
                 
                 print(f"\n✓ Stock prices saved: {all_prices_path}")
                 print(f"✓ Successfully downloaded {successful_downloads}/{len(master_df)} stock prices")
@@ -274,170 +504,114 @@ class NikkeiDataManager:
             # Construct Yahoo Finance Japan URL
             url = f"https://finance.yahoo.co.jp/quote/{stock_code}.T"
             
-            response = requests.get(url, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Method 1: Try JSON extraction method (more reliable)
-            try:
-                scripts = soup.find_all('script')
-                for script in scripts:
-                    if script.string and 'window.__PRELOADED_STATE__' in script.string:
-                        script_content = script.string
-                        break
-                else:
-                    # Fall through to CSS selector method
-                    raise Exception("No __PRELOADED_STATE__ found")
-                
-                # Extract JSON from the script using proper brace counting
-                start_marker = 'window.__PRELOADED_STATE__ = '
-                start_pos = script_content.find(start_marker)
-                if start_pos == -1:
-                    raise Exception("Could not find JSON start marker")
-                
-                json_start = start_pos + len(start_marker)
-                
-                # Find the closing of the JSON object by counting braces
-                brace_count = 0
-                json_end = json_start
-                for i, char in enumerate(script_content[json_start:]):
-                    if char == '{':
-                        brace_count += 1
-                    elif char == '}':
-                        brace_count -= 1
-                        if brace_count == 0:
-                            json_end = json_start + i + 1
-                            break
-                
-                json_str = script_content[json_start:json_end]
-                data = json.loads(json_str)
-                
-                # Navigate to the stock price data
-                current_price = None
-                prev_close = None
-                change = None
-                
-                # Check mainStocksPriceBoard for current price
-                if 'mainStocksPriceBoard' in data and data['mainStocksPriceBoard']:
-                    price_board = data['mainStocksPriceBoard']
-                    if 'priceBoard' in price_board and price_board['priceBoard']:
-                        board_data = price_board['priceBoard']
-                        
-                        # Get save price (most recent trading price)
-                        if 'savePrice' in board_data and board_data['savePrice']:
-                            save_price_str = str(board_data['savePrice']).replace(',', '')
-                            try:
-                                current_price = float(save_price_str)
-                            except ValueError:
-                                pass
-                        
-                        # Try regular price field if savePrice not available
-                        if current_price is None and 'price' in board_data and board_data['price'] != '---':
-                            price_str = str(board_data['price']).replace(',', '')
-                            try:
-                                current_price = float(price_str)
-                            except ValueError:
-                                pass
-                
-                # Check mainStocksDetail for previous close
-                if 'mainStocksDetail' in data and data['mainStocksDetail']:
-                    stock_detail = data['mainStocksDetail']
-                    if 'detail' in stock_detail and stock_detail['detail']:
-                        detail_data = stock_detail['detail']
-                        
-                        # Get previous price
-                        if 'previousPrice' in detail_data and detail_data['previousPrice']:
-                            prev_price_str = str(detail_data['previousPrice']).replace(',', '')
-                            try:
-                                prev_close = float(prev_price_str)
-                            except ValueError:
-                                pass
-                
-                # Calculate change
-                if current_price is not None and prev_close is not None:
-                    change = current_price - prev_close
-                
-                if current_price is not None:
-                    return {
-                        'current_price': current_price,
-                        'prev_close': prev_close,
-                        'change': change or 0.0,
-                        'timestamp': datetime.now()
-                    }
-            
-            except Exception as json_error:
-                print(f"JSON method failed for {stock_code}: {json_error}")
-            
-            # Method 2: Try CSS selectors as fallback
-            try:
-                # Look for price spans/divs with common class patterns
-                price_selectors = [
-                    'span._1fofaCjs',  # Main price display
-                    'span[data-field="price"]',
-                    '.stoksPrice',
-                    'div._1Y3qLpB6 span:first-child',  # Alternative price location
-                    '[data-test="price"]',
-                    '.price',
-                    'span[data-symbol]',
-                    '.Fw\\(b\\)',  # Bold font weight class
-                ]
-                
-                current_price = None
-                for selector in price_selectors:
-                    price_elem = soup.select_one(selector)
-                    if price_elem:
-                        price_text = price_elem.get_text().strip()
-                        # Remove commas and extract numeric value
-                        price_match = re.search(r'[\d,]+\.?\d*', price_text.replace(',', ''))
-                        if price_match:
-                            current_price = float(price_match.group().replace(',', ''))
-                            break
-                
-                if current_price is not None:
-                    return {
-                        'current_price': current_price,
-                        'prev_close': None,
-                        'change': 0.0,
-                        'timestamp': datetime.now()
-                    }
-            
-            except Exception as css_error:
-                print(f"CSS selector method failed for {stock_code}: {css_error}")
+            content = self._cached_get(url, timeout=10)
             
-            print(f"Could not find price data for {stock_code}")
-            return None
+            return self._parse_yahoo_quote_page(content, stock_code)
             
         except Exception as e:
             print(f"Error getting price for {stock_code}: {e}")
             return None
     
-    def get_business_day_offset(self, date, offset_days):
-        """Get business day with offset, skipping weekends"""
-        current = date
-        days_added = 0
+    def _parse_yahoo_quote_page(self, content, stock_code):
+        """Extract price data from a Yahoo Finance Japan quote page body (transport independent)"""
+        # Method 1: Try JSON extraction method (more reliable)
+        # The state blob is located by a byte search on the raw body, so no HTML parse is needed here
+        try:
+            # Extract JSON from the script
+            start_marker = b'window.__PRELOADED_STATE__ = '
+            start_pos = content.find(start_marker)
+            if start_pos == -1:
+                # Fall through to CSS selector method
+                raise Exception("No __PRELOADED_STATE__ found")
+            
+            # Decode only the state script, not the surrounding HTML (an inline script can't contain </script>)
+            json_start = start_pos + len(start_marker)
+            json_end = content.find(b'</script>', json_start)
+            script_content = content[json_start:json_end if json_end != -1 else None].decode('utf-8', errors='replace')
+            
+            # Parse the JSON object in C; raw_decode stops at its end and handles braces inside strings
+            data, _ = _JSON_DECODER.raw_decode(script_content)
+            
+            # Navigate to the stock price data
+            change = None
+            
+            # Save price (most recent trading price), else the regular price field
+            current_price = _json_float(_dig(data, 'mainStocksPriceBoard', 'priceBoard', 'savePrice'))
+            if current_price is None:
+                current_price = _json_float(_dig(data, 'mainStocksPriceBoard', 'priceBoard', 'price'))
+            
+            # Previous close from mainStocksDetail
+            prev_close = _json_float(_dig(data, 'mainStocksDetail', 'detail', 'previousPrice'))
+            
+            # Calculate change
+            if current_price is not None and prev_close is not None:
+                change = current_price - prev_close
+            
+            if current_price is not None:
+                return {
+                    'current_price': current_price,
+                    'prev_close': prev_close,
+                    'change': change or 0.0,
+                    'timestamp': datetime.now()
+                }
         
-        while days_added < abs(offset_days):
-            if offset_days > 0:
-                current += timedelta(days=1)
-            else:
-                current -= timedelta(days=1)
+        except Exception as json_error:
+            print(f"JSON method failed for {stock_code}: {json_error}")
+        
+        # Method 2: Try CSS selectors as fallback
+        try:
+            soup = BeautifulSoup(content, 'html.parser')
+            
+            # Look for price spans/divs with common class patterns
+            price_selectors = [
+                'span._1fofaCjs',  # Main price display
+                'span[data-field="price"]',
+                '.stoksPrice',
+                'div._1Y3qLpB6 span:first-child',  # Alternative price location
+                '[data-test="price"]',
+                '.price',
+                'span[data-symbol]',
+                '.Fw\\(b\\)',  # Bold font weight class
+            ]
+            
+            current_price = None
+            for selector in price_selectors:
+                price_elem = soup.select_one(selector)
+                if price_elem:
+                    # Remove commas and extract numeric value
+                    current_price = _parse_price(price_elem.get_text())
+                    if current_price is not None:
+                        break
             
-            # Skip weekends (Saturday=5, Sunday=6)
-            if current.weekday() < 5:
-                days_added += 1
+            if current_price is not None:
+                return {
+                    'current_price': current_price,
+                    'prev_close': None,
+                    'change': 0.0,
+                    'timestamp': datetime.now()
+                }
+        
+        except Exception as css_error:
+            print(f"CSS selector method failed for {stock_code}: {css_error}")
         
-        return current
+        print(f"Could not find price data for {stock_code}")
+        return None
+    
+    def get_business_day_offset(self, date, offset_days):
+        """Get business day with offset, skipping weekends"""
+        day = date.date() if isinstance(date, datetime) else date
+        target = _business_day_offset(day, offset_days)
+        # Shift the original value so datetime/Timestamp inputs keep their time and type
+        return date + timedelta(days=(target - day).days)
     
     def get_realtime_nikkei_price(self):
         """Get real-time Nikkei 225 price from Nikkei website"""
         try:
             url = "https://www.nikkei.com/markets/worldidx/chart/nk225/"
             
-            response = requests.get(url, headers=self.headers, timeout=10)
-            response.raise_for_status()
+            content = self._cached_get(url, timeout=10)
             
-            soup = BeautifulSoup(response.content, 'html.parser')
+            soup = BeautifulSoup(content, 'html.parser')
             
             # Extract price data based on discovered structure
             try:
@@ -450,10 +624,7 @@ class NikkeiDataManager:
                 # Find current price using the economic_value_now class
                 current_price_elem = soup.select_one('.economic_value_now')
                 if current_price_elem:
-                    current_text = current_price_elem.get_text().strip()
-                    current_match = re.search(r'[\d,]+\.?\d*', current_text.replace(',', ''))
-                    if current_match:
-                        current_price = float(current_match.group().replace(',', ''))
+                    current_price = _parse_price(current_price_elem.get_text())
                 
                 # Extract OHLC data from trend values with correct mapping
                 trend_values = soup.select('.m-trend_economic_table_value')
@@ -466,26 +637,10 @@ class NikkeiDataManager:
                         # Index 2: Low (安値)
                         # Index 3: Previous Close (前日終値)
                         
-                        open_text = trend_values[0].get_text().strip()
-                        open_match = re.search(r'[\d,]+\.?\d*', open_text.replace(',', ''))
-                        if open_match:
-                            open_price = float(open_match.group().replace(',', ''))
-                        
-                        high_text = trend_values[1].get_text().strip()
-                        high_match = re.search(r'[\d,]+\.?\d*', high_text.replace(',', ''))
-                        if high_match:
-                            high_price = float(high_match.group().replace(',', ''))
+                        open_price, high_price, low_price, prev_close = [
+                            _parse_price(value.get_text()) for value in trend_values[:4]
+                        ]
                         
-                        low_text = trend_values[2].get_text().strip()
-                        low_match = re.search(r'[\d,]+\.?\d*', low_text.replace(',', ''))
-                        if low_match:
-                            low_price = float(low_match.group().replace(',', ''))
-                        
-                        prev_text = trend_values[3].get_text().strip()
-                        prev_match = re.search(r'[\d,]+\.?\d*', prev_text.replace(',', ''))
-                        if prev_match:
-                            prev_close = float(prev_match.group().replace(',', ''))
-                            
                     except (ValueError, IndexError) as e:
                         print(f"Error parsing trend values: {e}")
                         pass
@@ -497,15 +652,9 @@ class NikkeiDataManager:
                         try:
                             daily_path = os.path.join(self.base_folder, "daily_data.csv")
                             if os.path.exists(daily_path):
-                                for encoding in ['shift-jis', 'utf-8', 'cp932']:
-                                    try:
-                                        df = pd.read_csv(daily_path, encoding=encoding, skipfooter=1, engine='python')
-                                        df.columns = df.columns.str.strip()
-                                        if len(df) > 0:
-                                            prev_close = float(df['終値'].iloc[-1])
-                                        break
-                                    except:
-                                        continue
+                                df = read_csv_cached(daily_path, skipfooter=1)
+                                if len(df) > 0:
+                                    prev_close = float(df['終値'].iloc[-1])
                         except:
                             pass
                     
@@ -542,24 +691,16 @@ class NikkeiDataManager:
             daily_data_path = os.path.join(self.base_folder, "daily_data.csv")
             
             # Load existing daily data
-            for encoding in ['shift-jis', 'utf-8', 'cp932']:
-                try:
-                    nikkei_df = pd.read_csv(daily_data_path, encoding=encoding, skipfooter=1, engine='python')
-                    nikkei_df.columns = nikkei_df.columns.str.strip()
-                    print(f"✓ Loaded daily_data.csv with encoding: {encoding}")
-                    break
-                except UnicodeDecodeError:
-                    continue
-            else:
-                print("✗ Could not load daily_data.csv")
+            try:
+                # Parse dates while reading
+                nikkei_df = read_csv_cached(daily_data_path, skipfooter=1, parse_dates=['データ日付'])
+            except (OSError, ValueError) as e:
+                print(f"✗ Could not load daily_data.csv: {e}")
                 return False
             
-            # Parse dates
-            nikkei_df['データ日付'] = pd.to_datetime(nikkei_df['データ日付'])
-            
             # Check if today's data is already present
             today = pd.Timestamp.now().normalize()
-            if today in nikkei_df['データ日付'].values:
+            if (nikkei_df['データ日付'] == today).any():
                 print(f"✓ Today's data ({today.strftime('%Y-%m-%d')}) already in daily_data.csv")
                 return True
             
@@ -573,7 +714,7 @@ class NikkeiDataManager:
             
             # Create new row for today
             new_row = {
-                'データ日付': today.strftime('%Y/%m/%d'),
+                'データ日付': today,
                 '始値': nikkei_data['open'],
                 '高値': nikkei_data['high'],
                 '安値': nikkei_data['low'],
@@ -585,7 +726,7 @@ class NikkeiDataManager:
             updated_df = pd.concat([nikkei_df, new_df], ignore_index=True)
             
             # Save updated data
-            updated_df.to_csv(daily_data_path, index=False, encoding='utf-8')
+            updated_df.to_csv(daily_data_path, index=False, encoding='utf-8', date_format='%Y/%m/%d')
             print(f"✓ Added today's data to daily_data.csv")
             
             return True
@@ -3,8 +3,11 @@ Market Cap Analyzer - Analyzes top market cap stocks
 """
 
 import pandas as pd
+import numpy as np
+import threading
 import time
-from config import TOP_20_MARKET_CAP
+from concurrent.futures import ThreadPoolExecutor
+from config import TOP_20_MARKET_CAP, SCRAPER_MAX_WORKERS, MARKET_CAP_CACHE_TTL
 from yahoo_jp_scraper import get_stock_price_yahoo_jp
 
 
@@ -13,6 +16,41 @@ class MarketCapAnalyzer:
     
     def __init__(self):
         self.top20_stocks = TOP_20_MARKET_CAP
+        
+        # (monotonic time, chart data) of the last successful scrape
+        self._cache = None
+        self._cache_lock = threading.Lock()
+    
+    def _fetch_stock_change(self, rank, code, name):
+        """Fetch one stock's price change, returning its result row and log lines (never raises)"""
+        row = {
+            'rank': rank,
+            'code': code,
+            'name': name,
+            'price': 0,
+            'change': 0,
+            'change_pct': 0
+        }
+        
+        try:
+            # Get stock data from Yahoo Finance Japan
+            stock_data = get_stock_price_yahoo_jp(code)
+            
+            if stock_data and stock_data['current_price']:
+                current_price = stock_data['current_price']
+                change = stock_data['change'] if stock_data['change'] is not None else 0
+                change_pct = stock_data['change_percent'] if stock_data['change_percent'] is not None else 0
+                
+                row.update(price=current_price, change=change, change_pct=change_pct)
+                return row, [
+                    f"  ✓ Price: ¥{current_price:,.1f}",
+                    f"  ✓ Change: {change:+.1f} ({change_pct:+.2f}%)",
+                ]
+            
+            return row, ["  ✗ Failed to get price data"]
+            
+        except Exception as e:
+            return row, [f"  ✗ Error: {e}"]
     
     def get_top20_price_changes(self):
         """Get price changes for top 20 market cap stocks"""
@@ -21,55 +59,21 @@ class MarketCapAnalyzer:
         print("FETCHING TOP 20 STOCKS PRICE CHANGES")
         print("=" * 50)
         
-        results = []
+        # Fetch all pages concurrently, collecting results back in rank order
+        with ThreadPoolExecutor(max_workers=SCRAPER_MAX_WORKERS) as executor:
+            futures = [
+                executor.submit(self._fetch_stock_change, i, code, name)
+                for i, (code, name) in enumerate(self.top20_stocks, 1)
+            ]
+            fetched = [future.result() for future in futures]
         
-        for i, (code, name) in enumerate(self.top20_stocks, 1):
-            print(f"{i}. Fetching data for {code} ({name})...")
-            
-            try:
-                # Get stock data from Yahoo Finance Japan
-                stock_data = get_stock_price_yahoo_jp(code)
-                
-                if stock_data and stock_data['current_price']:
-                    current_price = stock_data['current_price']
-                    change = stock_data['change'] if stock_data['change'] is not None else 0
-                    change_pct = stock_data['change_percent'] if stock_data['change_percent'] is not None else 0
-                    
-                    results.append({
-                        'rank': i,
-                        'code': code,
-                        'name': name,
-                        'price': current_price,
-                        'change': change,
-                        'change_pct': change_pct
-                    })
-                    
-                    print(f"  ✓ Price: ¥{current_price:,.1f}")
-                    print(f"  ✓ Change: {change:+.1f} ({change_pct:+.2f}%)")
-                else:
-                    print(f"  ✗ Failed to get price data")
-                    results.append({
-                        'rank': i,
-                        'code': code,
-                        'name': name,
-                        'price': 0,
-                        'change': 0,
-                        'change_pct': 0
-                    })
-                
-                # Rate limiting
-                time.sleep(0.1)
-                
-            except Exception as e:
-                print(f"  ✗ Error: {e}")
-                results.append({
-                    'rank': i,
-                    'code': code,
-                    'name': name,
-                    'price': 0,
-                    'change': 0,
-                    'change_pct': 0
-                })
+        results = []
+        for row, messages in fetched:
+            # Print each stock's log after the fact so concurrent output doesn't interleave
+            print(f"{row['rank']}. Fetching data for {row['code']} ({row['name']})...")
+            for message in messages:
+                print(message)
+            results.append(row)
         
         # Create DataFrame
         df = pd.DataFrame(results)
@@ -83,36 +87,61 @@ class MarketCapAnalyzer:
         if valid_results:
             print(f"✓ Successfully fetched {len(valid_results)}/{len(self.top20_stocks)} stocks")
             
-            # Sort by change percentage
-            df_valid = df[df['price'] > 0].copy()
-            df_sorted = df_valid.sort_values('change_pct', ascending=False)
+            # Select the 5 highest and lowest change percentages without sorting every row
+            df_valid = df.loc[df['price'] > 0]
+            change_pcts = df_valid['change_pct'].to_numpy()
+            k = min(5, len(change_pcts))
+            top = np.sort(np.argpartition(-change_pcts, k - 1)[:k])
+            bottom = np.sort(np.argpartition(change_pcts, k - 1)[:k])
+            
+            # Both lists print from highest to lowest change, like head/tail of a descending sort
+            top = top[np.argsort(-change_pcts[top], kind='stable')]
+            bottom = bottom[np.argsort(-change_pcts[bottom], kind='stable')]
             
             print("\n📈 TOP GAINERS:")
-            for _, row in df_sorted.head(5).iterrows():
-                if row['change_pct'] > 0:
-                    print(f"  {row['code']} {row['name']}: {row['change_pct']:+.2f}%")
+            for row in df_valid.iloc[top].itertuples(index=False):
+                if row.change_pct > 0:
+                    print(f"  {row.code} {row.name}: {row.change_pct:+.2f}%")
             
             print("\n📉 TOP LOSERS:")
-            for _, row in df_sorted.tail(5).iterrows():
-                if row['change_pct'] < 0:
-                    print(f"  {row['code']} {row['name']}: {row['change_pct']:+.2f}%")
+            for row in df_valid.iloc[bottom].itertuples(index=False):
+                if row.change_pct < 0:
+                    print(f"  {row.code} {row.name}: {row.change_pct:+.2f}%")
         
         return df
     
     def get_chart_data_json(self):
-        """Get chart data for web application"""
+        """Get chart data for web application, reusing a result younger than MARKET_CAP_CACHE_TTL"""
+        
+        # One lock serializes refreshes so concurrent misses trigger a single scrape
+        with self._cache_lock:
+            if self._cache is not None:
+                cached_at, chart_data = self._cache
+                if time.monotonic() - cached_at < MARKET_CAP_CACHE_TTL:
+                    return chart_data
+            
+            chart_data = self._build_chart_data()
+            
+            # Don't pin a failed scrape for the whole TTL
+            if chart_data['labels']:
+                self._cache = (time.monotonic(), chart_data)
+            
+            return chart_data
+    
+    def _build_chart_data(self):
+        """Scrape the top 20 stocks and build chart data"""
         
         # Get price changes
         df = self.get_top20_price_changes()
         
         # Sort by market cap rank (already in order)
         # But keep only stocks with valid data
-        df_valid = df[df['price'] > 0].copy()
+        df_valid = df.loc[df['price'] > 0]
         
         # Create chart data
         chart_data = {
             'labels': df_valid['name'].tolist(),
-            'values': df_valid['change_pct'].tolist(),
+            'values': df_valid['change_pct'].to_numpy(dtype=np.float64),
             'codes': df_valid['code'].tolist()
         }
         
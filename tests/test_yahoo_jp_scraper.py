@@ -0,0 +1,69 @@
+"""
+Tests for the streamed quote page fallback in yahoo_jp_scraper
+
+Run with: python -m unittest discover -s tests
+"""
+
+import contextlib
+import io
+import json
+import unittest
+from unittest import mock
+
+import requests
+
+import yahoo_jp_scraper
+
+STATE = {
+    'mainStocksPriceBoard': {'priceBoard': {
+        'name': '東京エレクトロン', 'marketName': '東証PRM',
+        'price': '25,000', 'priceChange': '+500', 'priceChangeRate': '+2.04%',
+    }},
+    'mainStocksDetail': {'detail': {'previousPrice': '24,500'}},
+}
+
+
+def _response(body):
+    """A streamed requests.Response over an in-memory body"""
+    response = requests.Response()
+    response.status_code = 200
+    response.raw = io.BytesIO(body)
+    return response
+
+
+def _fetch(body):
+    """Run the quote page fallback against body, returning (result, printed output)"""
+    output = io.StringIO()
+    with mock.patch.object(yahoo_jp_scraper._session, 'get', return_value=_response(body)), \
+            contextlib.redirect_stdout(output):
+        result = yahoo_jp_scraper._get_stock_price_quote_page('8035')
+    return result, output.getvalue()
+
+
+class QuotePageTest(unittest.TestCase):
+
+    def test_state_with_closing_script(self):
+        body = b'<html><script>window.__PRELOADED_STATE__ = ' + json.dumps(STATE).encode('utf-8') + \
+            b';</script>' + b'x' * 100000 + b'</html>'
+        result, _ = _fetch(body)
+        self.assertEqual(result['current_price'], 25000.0)
+        self.assertEqual(result['previous_close'], 24500.0)
+
+    def test_state_without_closing_script(self):
+        # The stream ends inside the state script; the object itself is complete
+        body = b'<html><script>window.__PRELOADED_STATE__ = ' + json.dumps(STATE).encode('utf-8')
+        result, output = _fetch(body)
+        self.assertIsNotNone(result, output)
+        self.assertEqual(result['name'], '東京エレクトロン')
+        self.assertEqual(result['change'], 500.0)
+        self.assertEqual(result['change_percent'], 2.04)
+
+    def test_page_without_marker(self):
+        result, output = _fetch(b'<html><body>' + b'x' * 200000 + b'</body></html>')
+        self.assertIsNone(result)
+        self.assertIn('Could not find PRELOADED_STATE marker', output)
+        self.assertNotIn('Network error', output)
+
+
+if __name__ == "__main__":
+    unittest.main()
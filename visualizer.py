@@ -3,10 +3,22 @@ Nikkei Visualizer - Provides chart data for web application
 """
 
 import pandas as pd
+import numpy as np
 import os
 from datetime import datetime
 
 
+def _top_k(series, k, ascending):
+    """First k values of series sorted, selecting with argpartition so only those k get sorted"""
+    keys = series.to_numpy() if ascending else -series.to_numpy()
+    if len(keys) > k:
+        # Ascending positions keep ties in original order after the stable sort below
+        idx = np.sort(np.argpartition(keys, k - 1)[:k])
+    else:
+        idx = np.arange(len(keys))
+    return series.iloc[idx[np.argsort(keys[idx], kind='stable')]]
+
+
 class NikkeiVisualizer:
     """Handles all visualization and charting for Nikkei 225 analysis"""
     
@@ -28,50 +40,43 @@ class NikkeiVisualizer:
             
             if results and 'industry_contributions' in results and not results['industry_contributions'].empty:
                 print(f"Processing industry contributions, shape: {results['industry_contributions'].shape}")
-                # Industry contributions
-                # Ensure index is datetime
-                if not isinstance(results['industry_contributions'].index, pd.DatetimeIndex):
-                    results['industry_contributions'].index = pd.to_datetime(results['industry_contributions'].index)
+                # Industry contributions (loaders guarantee a DatetimeIndex)
                 latest_date = results['industry_contributions'].index[-1]
                 print(f"Latest date: {latest_date}")
-                industry_contribs = results['industry_contributions'].loc[latest_date].dropna()
+                # Positional access to the last row avoids a label lookup
+                industry_contribs = results['industry_contributions'].iloc[-1].dropna()
                 print(f"Industry contributions: {len(industry_contribs)} items")
                 
                 # Keep Japanese industry names and sort by absolute value (descending)
-                sorted_industry = industry_contribs.reindex(industry_contribs.abs().sort_values(ascending=False).index)
+                sorted_industry = industry_contribs.iloc[np.argsort(-np.abs(industry_contribs.to_numpy()), kind='stable')]
                 
                 chart_data['industry_contributions'] = {
                     'labels': sorted_industry.index.tolist(),
-                    'values': sorted_industry.values.tolist()
+                    # Float arrays go straight to orjson; string labels stay lists (object arrays aren't serializable)
+                    'values': sorted_industry.to_numpy(dtype=np.float64)
                 }
                 
                 # Individual stock contributions (top 10 and bottom 10)
                 if 'stock_contributions' in results and not results['stock_contributions'].empty:
-                    # Ensure index is datetime
-                    if not isinstance(results['stock_contributions'].index, pd.DatetimeIndex):
-                        results['stock_contributions'].index = pd.to_datetime(results['stock_contributions'].index)
-                    stock_contribs = results['stock_contributions'].loc[latest_date].dropna()
+                    # Stock and industry tables share their date index, so the last row is latest_date
+                    stock_contribs = results['stock_contributions'].iloc[-1].dropna()
                     
                     # Get top 10 positive and bottom 10 negative
-                    positive_contribs = stock_contribs[stock_contribs > 0].sort_values(ascending=False).head(10)
-                    negative_contribs = stock_contribs[stock_contribs < 0].sort_values(ascending=True).head(10)
+                    positive_contribs = _top_k(stock_contribs[stock_contribs > 0], 10, ascending=False)
+                    negative_contribs = _top_k(stock_contribs[stock_contribs < 0], 10, ascending=True)
                     
                     # Combine: positive (descending) + negative (ascending = most negative first)
                     top_stocks = pd.concat([positive_contribs, negative_contribs])
                     
-                    # Convert stock codes to Japanese company names
-                    stock_labels = []
-                    for code in top_stocks.index:
-                        company_row = master_df[master_df['コード'] == int(code)]
-                        if not company_row.empty:
-                            company_name = company_row['銘柄名'].iloc[0]
-                            stock_labels.append(company_name)
-                        else:
-                            stock_labels.append(code)  # Fallback to code if name not found
+                    # Convert stock codes to Japanese company names (fallback to code if name not found)
+                    # One dict per call instead of a master_df scan per stock; the first occurrence of a code wins
+                    codes = master_df['コード'].astype(str)
+                    name_map = dict(zip(codes[::-1], master_df['銘柄名'][::-1]))
+                    stock_labels = [name_map.get(str(code), code) for code in top_stocks.index]
                     
                     chart_data['stock_contributions'] = {
                         'labels': stock_labels,
-                        'values': top_stocks.values.tolist()
+                        'values': top_stocks.to_numpy(dtype=np.float64)
                     }
                 
                 chart_data['last_updated'] = latest_date.strftime('%Y-%m-%d %H:%M:%S')
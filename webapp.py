@@ -9,22 +9,31 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
 from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
 import json
 import os
 from datetime import datetime
 import asyncio
-import threading
+import orjson
+import pandas as pd
 
-from data_manager import NikkeiDataManager
+from data_manager import NikkeiDataManager, is_fresh_copy
 from contribution_calculator import NikkeiContributionCalculator
 from visualizer import NikkeiVisualizer
 from market_cap_analyzer import MarketCapAnalyzer
 
+class ORJSONResponse(JSONResponse):
+    """JSON response serialized in C by orjson (NumPy values and NaN -> null handled natively)"""
+    
+    def render(self, content):
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
 app = FastAPI(
     title="Nikkei 225 Real-time Analysis", 
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse
 )
 
 # Mount static files
@@ -37,26 +46,27 @@ templates = Jinja2Templates(directory=template_dir)
 
 # Global variables to store analysis results
 current_data = None
-analysis_running = False
+analysis_lock = asyncio.Lock()
 last_update = None
 
 class NikkeiAnalysisService:
     """Service class to handle Nikkei analysis operations"""
     
     def __init__(self):
-        self.data_manager = None
+        # Built once and reused by every request (the pooled session and name map persist across calls)
+        self.data_manager = NikkeiDataManager()
         self.calculator = None
-        self.visualizer = None
+        self.visualizer = NikkeiVisualizer(self.data_manager.base_folder)
         self.market_cap_analyzer = MarketCapAnalyzer()
         
+        # Loaded contribution tables by name: ((path, mtime), DataFrame)
+        self._contributions_cache = {}
+        
     def run_analysis(self):
         """Run complete Nikkei analysis"""
         try:
             print("Starting Nikkei 225 analysis...")
             
-            # Initialize components
-            self.data_manager = NikkeiDataManager()
-            
             # Download master data (price adjustment factors)
             self.data_manager.download_master_data()
             
@@ -86,7 +96,6 @@ class NikkeiAnalysisService:
                 raise Exception("Failed to calculate contributions")
             
             # Generate chart data
-            self.visualizer = NikkeiVisualizer(self.data_manager.base_folder)
             chart_data = self.visualizer.get_chart_data_json(results, master_df, self.data_manager)
             
             # Get market cap data
@@ -100,17 +109,49 @@ class NikkeiAnalysisService:
             print(f"✗ Analysis failed: {e}")
             raise e
     
+    def _load_contributions(self, contributions_folder, name):
+        """Load saved contributions, preferring the Parquet copy over CSV.
+        
+        Loaded frames are memoized by path and mtime, so repeated calls skip disk
+        until the analysis rewrites the file.
+        """
+        parquet_path = os.path.join(contributions_folder, f"{name}.parquet")
+        csv_path = os.path.join(contributions_folder, f"{name}.csv")
+        # Fall back to the CSV when it was rewritten after the Parquet copy
+        path = parquet_path if is_fresh_copy(parquet_path, csv_path) else csv_path
+        if not os.path.exists(path):
+            return None
+        
+        cache_key = (path, os.path.getmtime(path))
+        cached = self._contributions_cache.get(name)
+        if cached is not None and cached[0] == cache_key:
+            return cached[1]
+        
+        if path == parquet_path:
+            df = pd.read_parquet(path, engine='pyarrow')
+        else:
+            # Arrow's multithreaded reader; the date index is converted below
+            df = pd.read_csv(path, engine='pyarrow', index_col=0)
+        
+        # Normalize once here so the visualizer can rely on a DatetimeIndex
+        df.index = pd.to_datetime(df.index)
+        
+        self._contributions_cache[name] = (cache_key, df)
+        return df
+    
     def get_existing_data(self):
         """Get existing analysis data without running new analysis"""
         try:
-            if not self.data_manager:
-                self.data_manager = NikkeiDataManager()
-            
             # Check if analysis files exist
             master_data_path = os.path.join(self.data_manager.base_folder, "price_adjustment_factor.csv")
-            contributions_path = os.path.join(self.data_manager.base_folder, "contributions", "stock_contributions.csv")
+            contributions_folder = os.path.join(self.data_manager.base_folder, "contributions")
             
-            if not os.path.exists(master_data_path) or not os.path.exists(contributions_path):
+            if not os.path.exists(master_data_path):
+                return None
+            
+            # Load existing results
+            stock_contributions = self._load_contributions(contributions_folder, "stock_contributions")
+            if stock_contributions is None:
                 return None
             
             # Load master data
@@ -118,26 +159,16 @@ class NikkeiAnalysisService:
             if master_df is None:
                 return None
             
-            # Load existing results
-            import pandas as pd
-            
-            stock_contributions = pd.read_csv(contributions_path, index_col=0, parse_dates=True)
-            sector_contributions_path = os.path.join(self.data_manager.base_folder, "contributions", "sector_contributions.csv")
-            industry_contributions_path = os.path.join(self.data_manager.base_folder, "contributions", "industry_contributions.csv")
-            
-            sector_contributions = pd.read_csv(sector_contributions_path, index_col=0, parse_dates=True) if os.path.exists(sector_contributions_path) else pd.DataFrame()
-            industry_contributions = pd.read_csv(industry_contributions_path, index_col=0, parse_dates=True) if os.path.exists(industry_contributions_path) else pd.DataFrame()
+            sector_contributions = self._load_contributions(contributions_folder, "sector_contributions")
+            industry_contributions = self._load_contributions(contributions_folder, "industry_contributions")
             
             results = {
                 'stock_contributions': stock_contributions,
-                'sector_contributions': sector_contributions,
-                'industry_contributions': industry_contributions
+                'sector_contributions': sector_contributions if sector_contributions is not None else pd.DataFrame(),
+                'industry_contributions': industry_contributions if industry_contributions is not None else pd.DataFrame()
             }
             
             # Generate chart data
-            if not self.visualizer:
-                self.visualizer = NikkeiVisualizer(self.data_manager.base_folder)
-            
             chart_data = self.visualizer.get_chart_data_json(results, master_df, self.data_manager)
             
             # Get market cap data
@@ -167,70 +198,61 @@ async def home(request: Request):
 @app.post("/api/analyze")
 async def analyze():
     """Run complete analysis"""
-    global current_data, analysis_running, last_update
+    global current_data, last_update
     
-    if analysis_running:
+    if analysis_lock.locked():
         raise HTTPException(status_code=409, detail="Analysis already running")
     
-    try:
-        analysis_running = True
-        
-        # Run analysis in thread to avoid blocking
-        def run_analysis_thread():
-            global current_data, last_update
-            try:
-                current_data = analysis_service.run_analysis()
-                last_update = datetime.now()
-                return True
-            except Exception as e:
-                import traceback
-                print(f"Analysis thread error: {e}")
-                print(f"Full traceback: {traceback.format_exc()}")
-                return False
-        
-        # For now, run synchronously (can be made async later)
-        success = run_analysis_thread()
-        
-        if success:
-            return {"success": True, "message": "Analysis completed successfully"}
-        else:
+    async with analysis_lock:
+        try:
+            # Run the blocking scrape + calculation in the worker pool so the event loop keeps serving requests
+            current_data = await run_in_threadpool(analysis_service.run_analysis)
+            last_update = datetime.now()
+        except Exception as e:
+            import traceback
+            print(f"Analysis error: {e}")
+            print(f"Full traceback: {traceback.format_exc()}")
             raise HTTPException(status_code=500, detail="Analysis failed")
-            
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        analysis_running = False
+    
+    return {"success": True, "message": "Analysis completed successfully"}
 
 @app.get("/api/data")
 async def get_data():
     """Get current chart data"""
     global current_data
     
-    if current_data is None:
-        # Try to load existing data
-        current_data = analysis_service.get_existing_data()
+    # Skip the lazy load while an analysis is rewriting the files it would read
+    if current_data is None and not analysis_lock.locked():
+        # Try to load existing data (file reads and scraping run off the event loop)
+        existing_data = await run_in_threadpool(analysis_service.get_existing_data)
         
+        # An analysis may have finished during the load; never replace its fresher results
         if current_data is None:
-            raise HTTPException(status_code=404, detail="No analysis data available. Please run analysis first.")
+            current_data = existing_data
+    
+    if current_data is None:
+        raise HTTPException(status_code=404, detail="No analysis data available. Please run analysis first.")
     
-    return current_data
+    # Returning the response directly skips FastAPI's jsonable_encoder pass over the chart data
+    return ORJSONResponse(current_data)
 
 @app.get("/api/market-cap")
 async def get_market_cap_data():
     """Get market cap top 20 stocks price changes"""
     try:
-        chart_data = analysis_service.market_cap_analyzer.get_chart_data_json()
-        return chart_data
+        # The scrape is blocking I/O; run it in the worker pool so other requests keep being served
+        chart_data = await run_in_threadpool(analysis_service.market_cap_analyzer.get_chart_data_json)
+        return ORJSONResponse(chart_data)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch market cap data: {str(e)}")
 
 @app.get("/api/status")
 async def get_status():
     """Get current analysis status"""
-    global analysis_running, last_update
+    global last_update
     
     return {
-        "running": analysis_running,
+        "running": analysis_lock.locked(),
         "last_update": last_update.isoformat() if last_update else None
     }
 
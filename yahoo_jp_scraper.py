@@ -2,87 +2,172 @@
 """
 Yahoo Finance Japan Stock Price Scraper
 
-This module provides functionality to scrape real-time stock prices
-from Yahoo Finance Japan using direct JSON extraction from web pages.
+This module provides functionality to fetch real-time stock prices
+from Yahoo Finance using the v8 chart JSON API, falling back to direct
+JSON extraction from Yahoo Finance Japan web pages.
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import re
 import time
 
+from config import YAHOO_JP_HEADERS, SCRAPER_MAX_WORKERS
+
+CHART_API_URL = "https://query1.finance.yahoo.com/v8/finance/chart/{code}.T"
+QUOTE_PAGE_URL = "https://finance.yahoo.co.jp/quote/{code}.T"
+
+PRELOADED_STATE_MARKER = b'window.__PRELOADED_STATE__ = '
+SCRIPT_END_MARKER = b'</script>'
+# Most of a page tail worth reading to keep its connection reusable
+MAX_DRAIN_BYTES = 256 * 1024
+
+_JSON_DECODER = json.JSONDecoder()
+
+# Characters stripped from scraped numbers before float conversion
+_CLEAN_RE = re.compile(r"[,\s円%]")
+
+# Keep-alive session shared by all calls (and the market cap analyzer's worker threads)
+_session = requests.Session()
+_session.headers.update(YAHOO_JP_HEADERS)
+_session.mount("https://", HTTPAdapter(
+    pool_connections=SCRAPER_MAX_WORKERS,
+    pool_maxsize=SCRAPER_MAX_WORKERS,
+    max_retries=Retry(total=2, backoff_factor=0.2),
+))
+
+
 def get_stock_price_yahoo_jp(stock_code):
     """
     Get stock price from Yahoo Finance Japan
     
+    Tries the compact v8 chart JSON API first and falls back to scraping
+    the quote page when Yahoo rejects or changes the API response.
+    
     Args:
         stock_code: Stock code (e.g., '8035' for Tokyo Electron)
     
     Returns:
         dict: Current price and previous close
     """
-    url = f"https://finance.yahoo.co.jp/quote/{stock_code}.T"
-    
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-    }
+    result = _get_stock_price_chart_api(stock_code)
+    if result is None:
+        result = _get_stock_price_quote_page(stock_code)
+    return result
+
+
+def _get_stock_price_chart_api(stock_code):
+    """Get stock price from the v8 chart JSON endpoint (a few KB instead of the full HTML page)"""
+    url = CHART_API_URL.format(code=stock_code)
     
     try:
-        response = requests.get(url, headers=headers, timeout=10)
+        response = _session.get(url, params={'interval': '1d', 'range': '1d'}, timeout=5)
         response.raise_for_status()
         
-        html_text = response.text
+        meta = response.json()['chart']['result'][0]['meta']
+        current_price = meta.get('regularMarketPrice')
+        previous_close = meta.get('chartPreviousClose')
+        if current_price is None:
+            return None
+        
+        result = {
+            'code': stock_code,
+            'url': url,
+            'name': meta.get('longName') or meta.get('shortName'),
+            'market': meta.get('fullExchangeName') or meta.get('exchangeName'),
+            'current_price': float(current_price),
+            'previous_close': float(previous_close) if previous_close is not None else None,
+            'change': None,
+            'change_percent': None
+        }
         
-        # Find the start of PRELOADED_STATE
-        start_marker = 'window.__PRELOADED_STATE__ = '
-        start_pos = html_text.find(start_marker)
+        if previous_close:
+            result['change'] = result['current_price'] - result['previous_close']
+            result['change_percent'] = result['change'] / result['previous_close'] * 100
         
-        if start_pos == -1:
-            print(f"Could not find PRELOADED_STATE marker for {stock_code}")
-            return None
+        return result
         
-        # Move to the start of the JSON
-        start_pos += len(start_marker)
+    except (requests.RequestException, ValueError, KeyError, IndexError, TypeError) as e:
+        # Yahoo intermittently blocks this API (e.g. 401); the quote page still works then
+        print(f"Chart API unavailable for {stock_code}, falling back to quote page: {e}")
+        return None
+
+
+def _to_float(value):
+    """Convert a scraped number such as '1,234円' or '+1.5%' to float, or None if empty/'---'/invalid"""
+    if not value or value == '---':
+        return None
+    try:
+        return float(_CLEAN_RE.sub('', str(value)))
+    except ValueError:
+        return None
+
+
+def _read_preloaded_state(chunks):
+    """Read streamed quote page chunks up to the end of the __PRELOADED_STATE__ script.
+    
+    Returns the raw bytes following the marker (the JSON object plus any trailing
+    ';'), or None if the marker never appears. HTML before the marker is discarded
+    as it arrives and reading stops at the closing script tag, leaving the rest of
+    the chunk iterator unread.
+    """
+    buffer = b''
+    json_start = -1
+    
+    for chunk in chunks:
+        # Rescan only the tail of the previous data, in case a marker straddles two chunks
+        if json_start == -1:
+            search_from = max(len(buffer) - len(PRELOADED_STATE_MARKER) + 1, 0)
+        else:
+            search_from = max(len(buffer) - len(SCRIPT_END_MARKER) + 1, json_start)
+        buffer += chunk
         
-        # Find the end by counting braces
-        brace_count = 0
-        in_string = False
-        escape_next = False
-        end_pos = start_pos
+        if json_start == -1:
+            marker_pos = buffer.find(PRELOADED_STATE_MARKER, search_from)
+            if marker_pos == -1:
+                # Keep just enough bytes to match a marker split across the boundary
+                buffer = buffer[-(len(PRELOADED_STATE_MARKER) - 1):]
+                continue
+            json_start = marker_pos + len(PRELOADED_STATE_MARKER)
+            search_from = json_start
         
-        for i in range(start_pos, min(start_pos + 500000, len(html_text))):  # Limit search
-            char = html_text[i]
+        # An inline script cannot contain a literal </script>, so the first one ends the state
+        end_pos = buffer.find(SCRIPT_END_MARKER, search_from)
+        if end_pos != -1:
+            return buffer[json_start:end_pos]
+    
+    return buffer[json_start:] if json_start != -1 else None
+
+
+def _get_stock_price_quote_page(stock_code):
+    """Get stock price by extracting __PRELOADED_STATE__ from the Yahoo Finance Japan quote page"""
+    url = QUOTE_PAGE_URL.format(code=stock_code)
+    
+    try:
+        # Stream the page and stop reading once the state script has closed
+        with _session.get(url, timeout=10, stream=True) as response:
+            response.raise_for_status()
+            # One iterator for both passes: iter_content cannot be restarted once the body is consumed
+            chunks = response.iter_content(chunk_size=65536)
+            state_bytes = _read_preloaded_state(chunks)
             
-            if escape_next:
-                escape_next = False
-                continue
-                
-            if char == '\\':
-                escape_next = True
-                continue
-                
-            if char == '"' and not escape_next:
-                in_string = not in_string
-                continue
-                
-            if not in_string:
-                if char == '{':
-                    brace_count += 1
-                elif char == '}':
-                    brace_count -= 1
-                    if brace_count == 0:
-                        end_pos = i + 1
-                        break
-        
-        if brace_count != 0:
-            print(f"Could not find complete JSON for {stock_code}")
-            return None
+            # urllib3 drops a connection closed mid-body; read out a short tail so it returns to the
+            # keep-alive pool, and only give the connection up when the rest of the page is large
+            drained = 0
+            for chunk in chunks:
+                drained += len(chunk)
+                if drained > MAX_DRAIN_BYTES:
+                    break
         
-        # Extract and parse JSON
-        json_str = html_text[start_pos:end_pos]
+        if state_bytes is None:
+            print(f"Could not find PRELOADED_STATE marker for {stock_code}")
+            return None
         
+        # Parse the JSON object in C; raw_decode stops at its end and handles braces inside strings
         try:
-            data = json.loads(json_str)
+            data, _ = _JSON_DECODER.raw_decode(state_bytes.decode('utf-8', errors='replace'))
         except json.JSONDecodeError as e:
             print(f"JSON decode error for {stock_code}: {e}")
             return None
@@ -106,48 +191,14 @@ def get_stock_price_yahoo_jp(stock_code):
             result['name'] = pb.get('name', '')
             result['market'] = pb.get('marketName', '')
             
-            # Current price
-            price_str = pb.get('price', '')
-            if price_str and price_str != '---':
-                try:
-                    # Handle both integer and decimal prices
-                    clean_price = price_str.replace(',', '').replace('円', '').strip()
-                    result['current_price'] = float(clean_price)
-                except ValueError:
-                    pass
-            
-            # Price change
-            change_str = pb.get('priceChange', '')
-            if change_str and change_str != '---':
-                try:
-                    # Handle both positive and negative changes with decimals
-                    clean_change = change_str.replace(',', '').replace('円', '').strip()
-                    result['change'] = float(clean_change)
-                except ValueError:
-                    pass
-            
-            # Change percent
-            rate_str = pb.get('priceChangeRate', '')
-            if rate_str and rate_str != '---':
-                try:
-                    # Handle percentage values
-                    clean_rate = rate_str.replace(',', '').replace('%', '').strip()
-                    result['change_percent'] = float(clean_rate)
-                except ValueError:
-                    pass
+            # Prices may carry thousands separators, 円 or % (e.g. '1,234.5', '+12.3%')
+            result['current_price'] = _to_float(pb.get('price'))
+            result['change'] = _to_float(pb.get('priceChange'))
+            result['change_percent'] = _to_float(pb.get('priceChangeRate'))
         
         # Get previous close from detail section
         if 'mainStocksDetail' in data and 'detail' in data['mainStocksDetail']:
-            detail = data['mainStocksDetail']['detail']
-            
-            prev_str = detail.get('previousPrice', '')
-            if prev_str and prev_str != '---':
-                try:
-                    # Handle decimal values in previous close
-                    clean_prev = prev_str.replace(',', '').replace('円', '').strip()
-                    result['previous_close'] = float(clean_prev)
-                except ValueError:
-                    pass
+            result['previous_close'] = _to_float(data['mainStocksDetail']['detail'].get('previousPrice'))
         
         return result
         